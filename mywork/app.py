@@ -1,11 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, abort
 import json
 import os
-from datetime import datetime
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import compensation_forms
+import evidence_store
+import review_queue
+import works_schema
+import write_behind
 
 app = Flask(__name__)
 app.secret_key = "academic_secret_key"
 
+# Surge mode: ช่วงใกล้วันปิดรับคำขอ ให้ตอบรับคำขอทันทีแล้วเขียน requests.json แบบ group commit
+app.config.update(
+    SURGE_MODE='auto',            # 'on' | 'off' | 'auto' (เปิดเองภายใน SURGE_WINDOW_HOURS ก่อน end_date)
+    SURGE_WINDOW_HOURS=48,
+    SURGE_MAX_BATCH_DELAY=0.05,   # วินาที
+    SURGE_MAX_BATCH_SIZE=500,
+    SURGE_FSYNC='always',         # 'always' | 'interval' | 'never'
+    WORKS_MAX_BYTES=256 * 1024,   # ขนาดสูงสุดของ works_data
+    WORKS_MAX_COUNT=50,           # จำนวนผลงานสูงสุดต่อคำขอ
+    WORKS_MAX_STRING=2000,        # ความยาวสูงสุดของข้อความแต่ละช่อง
+    REVIEW_LEASE_SECONDS=15 * 60, # lease ของผู้ตรวจหมดอายุถ้าไม่ต่ออายุภายในเวลานี้
+)
+
+# compile schema ของ works_data ครั้งเดียวตอนเริ่มระบบ
+validate_works = works_schema.compile_validator(
+    max_bytes=app.config['WORKS_MAX_BYTES'],
+    max_works=app.config['WORKS_MAX_COUNT'],
+    max_string=app.config['WORKS_MAX_STRING'])
+
 def load_data(filename):
     if not os.path.exists(filename):
         with open(filename, 'w', encoding='utf-8') as f:
@@ -35,6 +63,67 @@ def save_data(filename, data):
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
 
+request_writer = None
+request_writer_lock = threading.Lock()
+
+def get_request_writer():
+    # ต้องมี writer เดียวต่อ process ไม่เช่นนั้นรายการที่ค้างในคิวของอีกตัวจะมองไม่เห็น
+    global request_writer
+    with request_writer_lock:
+        if request_writer is None:
+            request_writer = write_behind.RequestWriter(
+                'requests.json',
+                max_batch_delay=app.config['SURGE_MAX_BATCH_DELAY'],
+                max_batch_size=app.config['SURGE_MAX_BATCH_SIZE'],
+                fsync=app.config['SURGE_FSYNC'])
+    return request_writer
+
+def is_surge_mode():
+    mode = app.config['SURGE_MODE']
+    if mode in ('on', 'off'): return mode == 'on'
+    timeline = load_config('timeline.json')
+    # timeline ที่อ่านไม่ได้ไม่ควรทำให้การบันทึกคำขอทุกครั้งล้ม ให้ถือว่าไม่อยู่ในช่วง surge
+    try:
+        end = datetime.strptime(timeline['end_date'], "%d/%m/%Y") + timedelta(days=1)
+    except (TypeError, KeyError, ValueError):
+        return False
+    return end - timedelta(hours=app.config['SURGE_WINDOW_HOURS']) <= datetime.now() <= end
+
+def load_requests():
+    """อ่าน requests.json รวมกับคำขอที่ตอบรับแล้วแต่ยังรอเขียนลงไฟล์ (ไฟล์เสียจะ raise StorageError)"""
+    return get_request_writer().read_all()
+
+def save_request(req_data):
+    """บันทึกคำขอเดียว (upsert ตาม id) โดยอ่านไฟล์ล่าสุดภายใต้ file lock จึงไม่ทับการแก้ไขของผู้อื่น"""
+    writer = get_request_writer()
+    # ถ้ายังมีรายการค้างในคิว ต้องเข้าคิวต่อท้ายเพื่อรักษาลำดับการเขียน
+    if is_surge_mode() or writer.has_pending():
+        writer.submit(req_data)
+    else:
+        writer.commit([req_data])
+
+@app.errorhandler(write_behind.StorageError)
+def storage_unavailable(e):
+    # ไม่แสดงหน้าว่างหรือแจ้งว่าบันทึกสำเร็จ ถ้าอ่าน/เขียน requests.json ไม่ได้
+    app.logger.error("requests.json unavailable: %s", e)
+    return "ระบบไม่สามารถอ่านหรือบันทึกข้อมูลคำขอได้ในขณะนี้ กรุณาลองใหม่ภายหลังหรือติดต่อผู้ดูแลระบบ", 503
+
+def new_request_id():
+    return f"REQ-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6].upper()}"
+
+# Map ประเภทผลงานจากหน้าเว็บเป็นข้อความที่ calculate_work_score ใช้
+WORK_TYPE_MAP = {
+    'research': 'บทความวิจัย',
+    'textbook': 'ตำรา',
+    'creative': 'งานสร้างสรรค์',
+    'social': 'สังคม', 'local': 'สังคม', # ท้องถิ่น/สังคม
+    'industry': 'อุตสาหกรรม',
+    'teaching': 'การสอน',
+    'policy': 'นโยบาย',
+    'innovation': 'นวัตกรรม',
+    'patent': 'นวัตกรรม', # Fallback
+}
+
 def calculate_work_score(work_type, work_level, role):
     """
     คำนวณคะแนน (Score) และค่าน้ำหนัก (Weight) ของผลงานแต่ละชิ้น
@@ -153,7 +242,7 @@ def login():
 @app.route('/dashboard')
 def dashboard():
     if 'username' not in session: return redirect(url_for('login'))
-    all_reqs = load_data('requests.json')
+    all_reqs = load_requests()
     if session['role'] == 'applicant':
         display_reqs = [r for r in all_reqs if r['applicant'] == session['username']]
     elif session['role'] == 'administration':
@@ -164,7 +253,43 @@ def dashboard():
         display_reqs = [r for r in all_reqs if r['status'] in ['รอการพิจารณา', 'รอการอุทธรณ์']]
     else:
         display_reqs = []
-    return render_template('dashboard.html', name=session['name'], role=session['role'], requests=display_reqs)
+    leases, faculties = {}, []
+    if session['role'] in review_queue.QUEUE_STATUSES:
+        leases = review_queue.active_leases()
+        faculties = sorted({(r.get('applicant_info') or {}).get('faculty') for r in display_reqs} - {None, ''})
+    return render_template('dashboard.html', name=session['name'], role=session['role'], requests=display_reqs, leases=leases, faculties=faculties)
+
+@app.route('/review/next')
+def review_next():
+    """รับคำขอถัดไปในคิวที่ยังไม่มีผู้ตรวจถือ lease (เลือกเฉพาะคณะได้)"""
+    if 'username' not in session or session['role'] not in review_queue.QUEUE_STATUSES: return redirect(url_for('login'))
+    req_id = review_queue.claim_next(load_requests, session['role'], session['username'], session['name'],
+                                     faculty=request.args.get('faculty'), ttl=app.config['REVIEW_LEASE_SECONDS'])
+    if not req_id:
+        flash("ไม่มีคำขอรอตรวจสอบในขณะนี้")
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('view_request', req_id=req_id))
+
+@app.route('/review/claim/<req_id>', methods=['POST'])
+def review_claim(req_id):
+    """รับตรวจคำขอที่เปิดดูอยู่ (ถ้ายังไม่มีผู้อื่นถือ lease)"""
+    if 'username' not in session or session['role'] not in review_queue.QUEUE_STATUSES: return redirect(url_for('login'))
+    req_data = next((r for r in load_requests() if r['id'] == req_id), None)
+    if not req_data or not review_queue.in_queue(req_data, session['role']):
+        flash("คำขอนี้ไม่อยู่ในคิวตรวจสอบของท่าน")
+        return redirect(url_for('dashboard'))
+    holder = review_queue.acquire(req_id, session['role'], session['username'], session['name'],
+                                  ttl=app.config['REVIEW_LEASE_SECONDS'])
+    if holder:
+        flash(f"คำขอนี้กำลังถูกตรวจสอบโดย {holder['reviewer_name']}")
+    return redirect(url_for('view_request', req_id=req_id))
+
+@app.route('/review/renew/<req_id>', methods=['POST'])
+def review_renew(req_id):
+    """ต่ออายุ lease ที่ถืออยู่ระหว่างที่ผู้ตรวจยังเปิดหน้าคำขออยู่ (ไม่รับ lease ใหม่)"""
+    if 'username' not in session: return jsonify({"held": False}), 401
+    held = review_queue.renew(req_id, session['username'], ttl=app.config['REVIEW_LEASE_SECONDS'])
+    return jsonify({"held": held})
 
 @app.route('/new_request', methods=['GET', 'POST'])
 def new_request():
@@ -183,7 +308,7 @@ def new_request():
     edit_id = request.args.get('edit_id')
     edit_req = None
     if edit_id:
-        all_reqs = load_data('requests.json')
+        all_reqs = load_requests()
         edit_req = next((r for r in all_reqs if r['id'] == edit_id and r['applicant'] == session['username']), None)
 
     if request.method == 'POST':
@@ -199,12 +324,20 @@ def new_request():
         # Let's assume we handle standard form submission but parse dynamic fields
         
         # Basic Info
-        req_id = request.form.get('req_id') or f"REQ-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        req_id = request.form.get('req_id') or new_request_id()
         
-        # Works Processing
-        # Works Processing
-        works_json = request.form.get('works_data')
-        works = json.loads(works_json) if works_json else []
+        # Works Processing: ตรวจโครงสร้างและขนาดข้อมูลก่อนคำนวณคะแนน
+        works, works_errors = validate_works(request.form.get('works_data'))
+        if works_errors:
+            timeline = load_config('timeline.json', {})
+            # ส่งข้อมูลที่กรอกไว้กลับไปให้แก้ไขต่อได้ (works เป็น None ถ้าข้อมูลทั้งก้อนใช้ไม่ได้ จึงไม่ parse ซ้ำ)
+            form_req = dict(edit_req or {},
+                            id=request.form.get('req_id'),
+                            fiscal_year=request.form.get('fiscal_year_req'),
+                            certify=bool(request.form.get('certify')),
+                            works=[{"type": w.get('type'), "details": w['details'] if isinstance(w.get('details'), dict) else {}}
+                                   for w in works or [] if isinstance(w, dict)])
+            return render_template('new_request.html', name=session['name'], role=session['role'], can_submit=can_submit, criteria=criteria, timeline=timeline, user=user_profile, edit_req=form_req, works_errors=works_errors), 400
 
         total_score = 0
         applicant_position = request.form.get('academic_position') or user_profile.get('academic_position', '')
@@ -215,17 +348,7 @@ def new_request():
             
             # 1. Map Work Type
             raw_type = work.get('type', '')
-            w_type = raw_type # Default fallback
-            
-            if raw_type == 'research': w_type = 'บทความวิจัย'
-            elif raw_type == 'textbook': w_type = 'ตำรา'
-            elif raw_type == 'creative': w_type = 'งานสร้างสรรค์'
-            elif raw_type == 'social' or raw_type == 'local': w_type = 'สังคม' # ท้องถิ่น/สังคม
-            elif raw_type == 'industry': w_type = 'อุตสาหกรรม'
-            elif raw_type == 'teaching': w_type = 'การสอน'
-            elif raw_type == 'policy': w_type = 'นโยบาย'
-            elif raw_type == 'innovation': w_type = 'นวัตกรรม'
-            elif raw_type == 'patent': w_type = 'นวัตกรรม' # Fallback
+            w_type = WORK_TYPE_MAP.get(raw_type, raw_type)
 
             # 2. Map Work Level/Database
             # Frontend uses different keys for different types. 'database' is prioritized (used for Level A+/A/B)
@@ -292,17 +415,8 @@ def new_request():
             "certify": True if request.form.get('certify') else False
         }
         
-        all_reqs = load_data('requests.json')
-        
-        # Update if exists, else append
-        existing_idx = next((i for i, r in enumerate(all_reqs) if r['id'] == req_id), -1)
-        if existing_idx > -1:
-            # Preserve some fields if needed, or just overwrite for Draft logic
-            all_reqs[existing_idx].update(req_data)
-        else:
-            all_reqs.append(req_data)
-            
-        save_data('requests.json', all_reqs)
+        # Update if exists, else append (ช่วง surge จะตอบรับทันทีแล้วเขียนแบบ group commit)
+        save_request(req_data)
         flash("บันทึกข้อมูลเรียบร้อยแล้ว")
         return redirect(url_for('dashboard'))
     
@@ -312,13 +426,36 @@ def new_request():
 @app.route('/view_request/<req_id>', methods=['GET', 'POST'])
 def view_request(req_id):
     if 'username' not in session: return redirect(url_for('login'))
-    all_reqs = load_data('requests.json')
+    all_reqs = load_requests()
     req_data = next((r for r in all_reqs if r['id'] == req_id), None)
     
     if not req_data:
         flash("ไม่พบข้อมูลคำขอ")
         return redirect(url_for('dashboard'))
 
+    # การเปิดดูไม่ถือ lease (รับงานผ่าน "รับงานถัดไป" หรือปุ่มรับตรวจเท่านั้น)
+    # ส่วนการบันทึกผลต้องได้ lease ภายใต้ file lock ก่อน จึงมีผู้ตรวจบันทึกผลได้เพียงคนเดียว
+    lease_holder, holds_lease = None, False
+    in_review_queue = review_queue.in_queue(req_data, session['role'])
+    if in_review_queue and request.method == 'POST':
+        lease_holder = review_queue.acquire(req_id, session['role'], session['username'], session['name'],
+                                            ttl=app.config['REVIEW_LEASE_SECONDS'])
+        if lease_holder:
+            flash(f"คำขอนี้กำลังถูกตรวจสอบโดย {lease_holder['reviewer_name']}")
+            return redirect(url_for('dashboard'))
+        holds_lease = True
+        # อ่านใหม่หลังได้ lease เผื่อผู้ตรวจคนก่อนเพิ่งบันทึกผลแล้วปล่อย lease
+        req_data = next((r for r in load_requests() if r['id'] == req_id), None)
+        if not req_data or not review_queue.in_queue(req_data, session['role']):
+            review_queue.release(req_id, session['username'])
+            flash("คำขอนี้ได้รับการตรวจสอบไปแล้ว")
+            return redirect(url_for('dashboard'))
+    elif in_review_queue:
+        lease = review_queue.active_leases().get(req_id)
+        holds_lease = bool(lease) and lease['reviewer'] == session['username']
+        if lease and not holds_lease:
+            lease_holder = lease
+
     if request.method == 'POST':
         action = request.form.get('action')
         
@@ -327,9 +464,12 @@ def view_request(req_id):
             req_data['title'] = request.form.get('title')
             req_data['category'] = request.form.get('category')
             req_data['evidence'] = request.form.get('evidence_link')
+            req_data['evidence_files'] = evidence_store.parse_evidence_files(
+                request.form.get('evidence_files'), session['username'],
+                attached={f['sha256'] for f in req_data.get('evidence_files') or []})
             req_data['status'] = "ส่งแล้ว" if action == "submit" else "แบบร่าง"
             req_data['date'] = datetime.now().strftime("%d/%m/%Y %H:%M")
-            save_data('requests.json', all_reqs)
+            save_request(req_data)
             flash("อัปเดตข้อมูลเรียบร้อยแล้ว")
             return redirect(url_for('dashboard'))
         
@@ -350,7 +490,7 @@ def view_request(req_id):
                 req_data['comment'] = request.form.get('comment')
                 req_data['rejection_date'] = datetime.now().strftime("%d/%m/%Y")
                 flash("ปฏิเสธคำขอเรียบร้อยแล้ว")
-            save_data('requests.json', all_reqs)
+            save_request(req_data)
             return redirect(url_for('dashboard'))
 
         # Research Actions
@@ -363,7 +503,8 @@ def view_request(req_id):
             elif action == 'verify':
                 req_data['status'] = 'ผลงานถูกต้อง'
                 flash("แจ้งผลงานถูกต้องไปยังงานบริหารแล้ว")
-            save_data('requests.json', all_reqs)
+            save_request(req_data)
+            review_queue.release(req_id, session['username'])
             return redirect(url_for('dashboard'))
 
         # Committee Actions
@@ -383,15 +524,17 @@ def view_request(req_id):
                      if 'appeal' not in req_data: req_data['appeal'] = {}
                      req_data['appeal']['status'] = 'ไม่ผ่าน'
                 flash("ไม่อนุมัติคำขอ")
-            save_data('requests.json', all_reqs)
+            save_request(req_data)
+            review_queue.release(req_id, session['username'])
             return redirect(url_for('dashboard'))
 
-    return render_template('view_request.html', name=session['name'], role=session['role'], req=req_data)
+    return render_template('view_request.html', name=session['name'], role=session['role'], req=req_data,
+                           in_review_queue=in_review_queue, lease_holder=lease_holder, holds_lease=holds_lease, lease_seconds=app.config['REVIEW_LEASE_SECONDS'])
 
 @app.route('/appeal/<req_id>', methods=['GET', 'POST'])
 def appeal_request(req_id):
     if 'username' not in session or session['role'] != 'applicant': return redirect(url_for('login'))
-    all_reqs = load_data('requests.json')
+    all_reqs = load_requests()
     req_data = next((r for r in all_reqs if r['id'] == req_id), None)
     
     if not req_data or req_data['status'] != 'ไม่ผ่าน':
@@ -413,15 +556,114 @@ def appeal_request(req_id):
         req_data['appeal'] = {
             "reason": request.form.get('reason'),
             "evidence": request.form.get('evidence_link'),
+            "evidence_files": evidence_store.parse_evidence_files(request.form.get('evidence_files'), session['username']),
             "date": datetime.now().strftime("%d/%m/%Y %H:%M"),
             "status": "รอพิจารณา"
         }
-        save_data('requests.json', all_reqs)
+        save_request(req_data)
         flash("ยื่นอุทธรณ์เรียบร้อยแล้ว")
         return redirect(url_for('view_request', req_id=req_id))
 
     return render_template('appeal_request.html', name=session['name'], role=session['role'], req=req_data)
 
+@app.route('/print_forms')
+def print_forms():
+    """พิมพ์แบบฟอร์มขอรับค่าตอบแทนของคำขอที่อนุมัติแล้วทั้งชุด (zip)"""
+    if 'username' not in session or session['role'] != 'administration': return redirect(url_for('login'))
+    try:
+        reqs = compensation_forms.select_requests(
+            load_requests(),
+            status=request.args.get('status', 'อนุมัติ'),
+            fiscal_year=request.args.get('fiscal_year'),
+            faculty=request.args.get('faculty'))
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('dashboard'))
+    if not reqs:
+        flash("ไม่พบคำขอตามเงื่อนไขที่เลือก")
+        return redirect(url_for('dashboard'))
+
+    archive = tempfile.TemporaryFile()
+    try:
+        stats = compensation_forms.render_batch(reqs, archive, fmt=request.args.get('format', 'html'))
+    except ValueError as e:
+        archive.close()
+        flash(str(e))
+        return redirect(url_for('dashboard'))
+    if not stats['count']:
+        archive.close()
+        flash("ไม่สามารถสร้างแบบฟอร์มได้ ข้อมูลคำขอที่เลือกไม่ถูกต้องทั้งหมด")
+        return redirect(url_for('dashboard'))
+    app.logger.info("print_forms: %d forms (%d skipped) in %.2fs (%.1f forms/s)",
+                    stats['count'], len(stats['skipped']), stats['seconds'], stats['forms_per_sec'])
+    archive.seek(0)
+    response = send_file(archive, mimetype='application/zip', as_attachment=True,
+                         download_name=f"compensation_forms_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip")
+    response.headers['X-Forms-Per-Second'] = f"{stats['forms_per_sec']:.1f}"
+    response.headers['X-Forms-Skipped'] = str(len(stats['skipped']))
+    return response
+
+# --- Evidence Upload (resumable, content-addressed) ---
+# 1. POST /evidence/uploads            {name, size} -> {id, offset}
+# 2. PUT  /evidence/uploads/<id>       body = ข้อมูลช่วงถัดไป, header Upload-Offset
+# 3. GET  /evidence/uploads/<id>       ดู offset ล่าสุดเพื่ออัปโหลดต่อจากจุดเดิม
+# เมื่อครบทั้งไฟล์จะได้ sha256 กลับมา ใช้แนบกับคำขอผ่าน hidden field "evidence_files"
+
+@app.route('/evidence/uploads', methods=['POST'])
+def evidence_upload_create():
+    if 'username' not in session: return jsonify({"error": "กรุณาเข้าสู่ระบบ"}), 401
+    payload = request.get_json(silent=True)
+    try:
+        if not isinstance(payload, dict):
+            raise evidence_store.UploadError("รูปแบบข้อมูลไม่ถูกต้อง")
+        upload = evidence_store.create_upload(payload.get('name'), payload.get('size'), session['username'])
+    except evidence_store.UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    return jsonify(upload), 201
+
+@app.route('/evidence/uploads/<upload_id>', methods=['GET', 'PUT'])
+def evidence_upload_chunk(upload_id):
+    if 'username' not in session: return jsonify({"error": "กรุณาเข้าสู่ระบบ"}), 401
+    try:
+        if request.method == 'GET':
+            return jsonify(evidence_store.get_upload(upload_id, session['username']))
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({"error": "ไม่พบ Upload-Offset"}), 400
+        # อ่านจาก request.stream โดยตรง ไม่ให้ Flask โหลดทั้ง body เข้าหน่วยความจำ
+        result = evidence_store.append_chunk(upload_id, session['username'], offset, request.stream)
+    except evidence_store.UploadError as e:
+        return jsonify({"error": e.message, "offset": e.offset}), e.status
+    return jsonify(result)
+
+def can_view_evidence(sha256):
+    """ดาวน์โหลดได้ถ้าเป็นผู้อัปโหลดเอง หรือไฟล์แนบอยู่กับคำขอที่ผู้ใช้เปิดดูได้ (ผู้ยื่นเห็นเฉพาะคำขอของตน)"""
+    if evidence_store.uploaded_by(sha256, session['username']):
+        return True
+    for r in load_requests():
+        if session['role'] == 'applicant' and r.get('applicant') != session['username']:
+            continue
+        files = list(r.get('evidence_files') or []) + list((r.get('appeal') or {}).get('evidence_files') or [])
+        if any(f.get('sha256') == sha256 for f in files):
+            return True
+    return False
+
+@app.route('/evidence/<sha256>')
+def evidence_file(sha256):
+    if 'username' not in session: return redirect(url_for('login'))
+    path = evidence_store.object_path(sha256)
+    if not path or not can_view_evidence(sha256): abort(404)
+    # ส่งเป็นไฟล์แนบเสมอ ไม่ให้เบราว์เซอร์เปิด HTML/SVG ที่อัปโหลดมาใน origin ของระบบ
+    # conditional=True รองรับ Range / If-None-Match สำหรับไฟล์ขนาดใหญ่
+    response = send_file(os.path.abspath(path), mimetype='application/octet-stream', as_attachment=True,
+                         conditional=True, etag=sha256, max_age=3600,
+                         download_name=request.args.get('name') or sha256)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @app.route('/manage', methods=['GET', 'POST'])
 def manage_system():
     if 'username' not in session or session['role'] != 'admin': return redirect(url_for('login'))
@@ -0,0 +1,207 @@
+"""
+สร้างแบบฟอร์มขอรับเงินค่าตอบแทน (พร้อมพิมพ์) ทีละหลายคำขอ แล้วรวมเป็นไฟล์ zip เดียว
+
+- HTML render ใน process เดียวกัน ด้วย template ที่ compile ไว้ครั้งเดียว
+- PDF (ถ้าติดตั้ง weasyprint ไว้) กระจายไปยัง process pool ที่สร้างครั้งเดียวและจำกัดจำนวน worker
+- คำขอที่ข้อมูลผิดรูปแบบจะถูกข้ามและรายงานไว้ในไฟล์ ERRORS.txt ใน zip แทนการล้มทั้งชุด
+
+ใช้งาน: python compensation_forms.py --status อนุมัติ --fiscal-year 2569 --out forms.zip
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from werkzeug.utils import secure_filename
+
+try:
+    from weasyprint import HTML
+except ImportError:
+    HTML = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATE_CACHE_DIR = os.path.join(BASE_DIR, '.template_cache')
+FORM_TEMPLATE = 'compensation_form.html'
+
+# พิมพ์แบบฟอร์มได้เฉพาะคำขอที่อนุมัติแล้ว
+PRINTABLE_STATUSES = ('อนุมัติ',)
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+logger = logging.getLogger(__name__)
+
+TYPE_LABELS = {
+    'research': 'บทความวิจัย',
+    'textbook': 'ตำรา/หนังสือ',
+    'creative': 'งานสร้างสรรค์',
+    'social': 'ผลงานรับใช้ท้องถิ่นและสังคม',
+    'local': 'ผลงานรับใช้ท้องถิ่นและสังคม',
+    'industry': 'ผลงานวิชาการเพื่ออุตสาหกรรม',
+    'teaching': 'ผลงานการสอน',
+    'policy': 'ผลงานนโยบายสาธารณะ',
+    'innovation': 'ผลงานนวัตกรรม',
+}
+
+_template = None
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    """เรียกครั้งเดียวต่อ process: compile template แล้วเก็บไว้ใช้ซ้ำ (bytecode เก็บในดิสก์ให้ process ใหม่ใช้ต่อ)"""
+    global _template
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(['html']),
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+        auto_reload=False,
+    )
+    _template = env.get_template(FORM_TEMPLATE)
+
+
+def _to_amount(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def entry_name(req, fmt):
+    """ชื่อไฟล์ใน zip จาก id คำขอ (id มาจากฟอร์มของผู้ยื่น จึงต้องกัน path traversal)"""
+    return f"{secure_filename(str(req.get('id', ''))) or 'request'}.{fmt}"
+
+
+def render_form(req, fmt='html'):
+    """render แบบฟอร์มของคำขอเดียว คืนค่า (ชื่อไฟล์, ข้อมูล bytes)"""
+    if _template is None:
+        _init_worker()
+    html = _template.render(req=req, type_labels=TYPE_LABELS,
+                            approved_amount=_to_amount(req.get('approved_amount')))
+    if fmt == 'pdf':
+        return entry_name(req, fmt), HTML(string=html, base_url=BASE_DIR).write_pdf()
+    return entry_name(req, fmt), html.encode('utf-8')
+
+
+def _render_safe(req, fmt):
+    """render แบบฟอร์มเดียว คืนค่า (ชื่อไฟล์, ข้อมูล, None) หรือ (id, None, ข้อความผิดพลาด)"""
+    try:
+        name, data = render_form(req, fmt)
+        return name, data, None
+    except Exception as e:
+        return str(req.get('id', '?')), None, f"{type(e).__name__}: {e}"
+
+
+def _get_pdf_pool():
+    """process pool สำหรับ PDF สร้างครั้งเดียวแล้วใช้ซ้ำ worker จึง compile template แค่ครั้งแรก"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # ใช้ spawn เพื่อไม่ fork ออกจาก process ของเว็บที่มีหลาย thread
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker)
+        return _pdf_pool
+
+
+def _discard_pdf_pool(pool):
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+
+def select_requests(all_reqs, status='อนุมัติ', fiscal_year=None, faculty=None):
+    """กรองคำขอที่จะพิมพ์ตามสถานะ (ต้องเป็นหนึ่งใน PRINTABLE_STATUSES) ปีงบประมาณ และคณะ"""
+    if status not in PRINTABLE_STATUSES:
+        raise ValueError("พิมพ์แบบฟอร์มได้เฉพาะคำขอที่อนุมัติแล้ว")
+    selected = []
+    for r in all_reqs:
+        if not isinstance(r, dict) or r.get('status') != status: continue
+        if fiscal_year and str(r.get('fiscal_year')) != str(fiscal_year): continue
+        if faculty and (r.get('applicant_info') or {}).get('faculty') != faculty: continue
+        selected.append(r)
+    return selected
+
+
+def render_batch(reqs, out_path, fmt='html'):
+    """
+    render ทุกคำขอใน reqs แล้วเขียนลง zip ไฟล์เดียว
+    HTML render ใน process นี้ (เร็วกว่าการส่งงานข้าม process มาก) ส่วน PDF ใช้ process pool ที่ใช้ร่วมกัน
+    คืนค่าสถิติ {count, skipped, seconds, forms_per_sec, path} โดย skipped เป็น list ของ (id, ข้อความผิดพลาด)
+    """
+    if fmt not in ('html', 'pdf'):
+        raise ValueError("รองรับเฉพาะรูปแบบ html หรือ pdf")
+    if fmt == 'pdf' and HTML is None:
+        raise ValueError("ต้องติดตั้ง weasyprint เพื่อสร้างไฟล์ PDF")
+
+    start = time.perf_counter()
+    if fmt == 'pdf':
+        pool = _get_pdf_pool()
+        chunksize = max(1, len(reqs) // (PDF_WORKERS * 4))
+        results = pool.map(_render_safe, reqs, [fmt] * len(reqs), chunksize=chunksize)
+    else:
+        results = (_render_safe(req, fmt) for req in reqs)
+
+    count, skipped, used = 0, [], set()
+    try:
+        with zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data, error in results:
+                if error:
+                    logger.warning("ข้ามแบบฟอร์มของคำขอ %s: %s", name, error)
+                    skipped.append((name, error))
+                    continue
+                # id ต่างกันอาจได้ชื่อไฟล์เดียวกันหลัง secure_filename
+                base, ext = os.path.splitext(name)
+                n = 1
+                while name in used:
+                    n += 1
+                    name = f"{base}-{n}{ext}"
+                used.add(name)
+                archive.writestr(name, data)
+                count += 1
+            if skipped:
+                archive.writestr('ERRORS.txt', "\n".join(f"{req_id}\t{error}" for req_id, error in skipped) + "\n")
+    except BrokenProcessPool:
+        _discard_pdf_pool(pool)
+        raise ValueError("การสร้างไฟล์ PDF ล้มเหลว กรุณาลองใหม่อีกครั้ง")
+    seconds = time.perf_counter() - start
+    return {
+        "count": count,
+        "skipped": skipped,
+        "seconds": seconds,
+        "forms_per_sec": count / seconds if seconds else 0.0,
+        "path": out_path,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests-file', default='requests.json')
+    parser.add_argument('--status', default='อนุมัติ', choices=PRINTABLE_STATUSES)
+    parser.add_argument('--fiscal-year')
+    parser.add_argument('--faculty')
+    parser.add_argument('--format', choices=['html', 'pdf'], default='html')
+    parser.add_argument('--out', default='compensation_forms.zip')
+    args = parser.parse_args()
+
+    with open(args.requests_file, 'r', encoding='utf-8') as f:
+        all_reqs = json.load(f)
+    reqs = select_requests(all_reqs, args.status, args.fiscal_year, args.faculty)
+    stats = render_batch(reqs, args.out, args.format)
+    print(f"{stats['count']} forms -> {stats['path']} in {stats['seconds']:.2f}s "
+          f"({stats['forms_per_sec']:.1f} forms/s)")
+    for req_id, error in stats['skipped']:
+        print(f"skipped {req_id}: {error}")
+
+
+if __name__ == '__main__':
+    main()
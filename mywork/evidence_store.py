@@ -0,0 +1,281 @@
+"""
+ที่เก็บไฟล์หลักฐาน (Evidence) แบบ content-addressed บนดิสก์
+
+- อัปโหลดแบบแบ่งเป็นช่วง (chunk) และต่อจากจุดเดิมได้ (resumable)
+- เขียนลงดิสก์ทีละช่วงโดยไม่อ่านทั้งไฟล์เข้าหน่วยความจำ
+- เก็บไฟล์ตาม SHA-256 ของเนื้อหา ไฟล์เดียวกันที่แนบหลายคำขอจะถูกเก็บเพียงชุดเดียว
+- บันทึกว่าใครเคยอัปโหลดไฟล์ใด แนบได้เฉพาะไฟล์ที่ตนอัปโหลดเอง
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+EVIDENCE_DIR = 'evidence'
+OBJECTS_DIR = os.path.join(EVIDENCE_DIR, 'objects')
+UPLOADS_DIR = os.path.join(EVIDENCE_DIR, 'uploads')
+OWNERS_DIR = os.path.join(EVIDENCE_DIR, 'owners')
+
+CHUNK_SIZE = 64 * 1024
+MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB ต่อไฟล์
+MAX_OPEN_UPLOADS = 5               # รายการที่ยังอัปโหลดไม่ครบได้ไม่เกินเท่านี้ต่อผู้ใช้
+UPLOAD_EXPIRY_SECONDS = 24 * 60 * 60  # รายการที่ไม่มีความเคลื่อนไหวนานกว่านี้จะถูกลบ
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """ข้อผิดพลาดระหว่างอัปโหลด พร้อม HTTP status ที่ควรตอบกลับ"""
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+def _upload_paths(upload_id):
+    if not _UPLOAD_ID_RE.match(upload_id or ''):
+        raise UploadError("ไม่พบรายการอัปโหลด", 404)
+    base = os.path.join(UPLOADS_DIR, upload_id)
+    return base + '.json', base + '.part', base + '.lock'
+
+
+@contextmanager
+def _locked(lock_path):
+    """ล็อกไฟล์แบบ exclusive กันหลาย worker แก้รายการเดียวกันพร้อมกัน"""
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_meta(meta_path, upload):
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(upload, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def _last_activity(*paths):
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.path.getmtime(path))
+        except OSError:
+            pass
+    return max(mtimes, default=0)
+
+
+def cleanup_expired_uploads():
+    """ลบรายการอัปโหลดที่ไม่มีความเคลื่อนไหวเกิน UPLOAD_EXPIRY_SECONDS รวมไฟล์ .part ที่ค้างอยู่"""
+    if not os.path.isdir(UPLOADS_DIR):
+        return
+    cutoff = time.time() - UPLOAD_EXPIRY_SECONDS
+    upload_ids = {name.split('.', 1)[0] for name in os.listdir(UPLOADS_DIR)}
+    for upload_id in upload_ids:
+        if not _UPLOAD_ID_RE.match(upload_id):
+            continue
+        meta_path, part_path, lock_path = _upload_paths(upload_id)
+        with _locked(lock_path):
+            if _last_activity(meta_path, part_path) >= cutoff:
+                continue
+            for path in (meta_path, part_path, meta_path + '.tmp'):
+                if os.path.exists(path):
+                    os.remove(path)
+        os.remove(lock_path)
+
+
+def _count_open_uploads(owner):
+    count = 0
+    for name in os.listdir(UPLOADS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(UPLOADS_DIR, name), 'r', encoding='utf-8') as f:
+                upload = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if upload.get('owner') == owner and 'sha256' not in upload:
+            count += 1
+    return count
+
+
+def object_path(sha256):
+    """คืน path ของไฟล์ตาม hash หรือ None ถ้าไม่มีในระบบ"""
+    if not _SHA256_RE.match(sha256 or ''):
+        return None
+    path = os.path.join(OBJECTS_DIR, sha256[:2], sha256)
+    return path if os.path.exists(path) else None
+
+
+def _owner_marker(sha256, owner):
+    return os.path.join(OWNERS_DIR, sha256, hashlib.sha256(owner.encode('utf-8')).hexdigest())
+
+
+def _record_owner(sha256, owner):
+    """จดว่า owner อัปโหลดไฟล์นี้ (ไฟล์ว่างหนึ่งไฟล์ต่อผู้อัปโหลด)"""
+    marker = _owner_marker(sha256, owner)
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    open(marker, 'a').close()
+
+
+def uploaded_by(sha256, owner):
+    """owner เคยอัปโหลดไฟล์นี้ครบทั้งไฟล์หรือไม่"""
+    if not owner or not object_path(sha256):
+        return False
+    return os.path.exists(_owner_marker(sha256, owner))
+
+
+def create_upload(name, size, owner):
+    """เริ่มรายการอัปโหลดใหม่ คืนค่า metadata ของรายการ"""
+    if name is not None and not isinstance(name, str):
+        raise UploadError("ชื่อไฟล์ไม่ถูกต้อง")
+    if isinstance(size, bool):
+        raise UploadError("ขนาดไฟล์ไม่ถูกต้อง")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("ขนาดไฟล์ไม่ถูกต้อง")
+    if size <= 0:
+        raise UploadError("ขนาดไฟล์ไม่ถูกต้อง")
+    if size > MAX_FILE_SIZE:
+        raise UploadError("ไฟล์มีขนาดใหญ่เกินกำหนด", 413)
+
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    upload = {
+        "id": uuid.uuid4().hex,
+        "name": os.path.basename(name or '')[:255] or 'evidence',
+        "size": size,
+        "owner": owner,
+        "created": datetime.now().strftime("%d/%m/%Y %H:%M"),
+    }
+    meta_path, part_path, _ = _upload_paths(upload['id'])
+    # นับและสร้างภายใต้ lock เดียวกัน จึงเปิดรายการเกินโควตาพร้อมกันไม่ได้
+    with _locked(os.path.join(UPLOADS_DIR, '.lock')):
+        cleanup_expired_uploads()
+        if _count_open_uploads(owner) >= MAX_OPEN_UPLOADS:
+            raise UploadError("มีไฟล์ที่ยังอัปโหลดไม่เสร็จมากเกินไป กรุณาอัปโหลดไฟล์เดิมให้เสร็จก่อน", 429)
+        open(part_path, 'wb').close()
+        _write_meta(meta_path, upload)
+    upload['offset'] = 0
+    return upload
+
+
+def get_upload(upload_id, owner):
+    """
+    อ่านสถานะรายการอัปโหลด (ใช้ตอนต่อการอัปโหลดจากจุดเดิม)
+    รายการที่อัปโหลดครบแล้วจะมี sha256 และ complete เป็น True
+    """
+    meta_path, part_path, _ = _upload_paths(upload_id)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            upload = json.load(f)
+    except (OSError, ValueError):
+        raise UploadError("ไม่พบรายการอัปโหลด", 404)
+    if upload['owner'] != owner:
+        raise UploadError("ไม่พบรายการอัปโหลด", 404)
+    if 'sha256' in upload:
+        upload['offset'] = upload['size']
+        upload['complete'] = True
+    else:
+        upload['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    return upload
+
+
+def append_chunk(upload_id, owner, offset, stream):
+    """
+    เขียนข้อมูลช่วงถัดไปต่อท้ายไฟล์ชั่วคราว โดยอ่านจาก stream ทีละ CHUNK_SIZE
+    offset ต้องตรงกับขนาดที่เขียนไปแล้ว มิฉะนั้นตอบ 409 พร้อม offset ปัจจุบัน
+    คืนค่า metadata ของรายการ (ถ้าครบทั้งไฟล์จะมี sha256 ด้วย)
+    ถ้ารายการครบแล้ว (เช่น client ส่งช่วงสุดท้ายซ้ำเพราะไม่ได้รับคำตอบ) จะได้ผลเดิมกลับไป
+    """
+    _, part_path, lock_path = _upload_paths(upload_id)
+    get_upload(upload_id, owner)  # ไม่สร้างไฟล์ lock ให้รายการที่ไม่มีอยู่
+
+    # ล็อกตลอดช่วงเขียนและ finalize เพื่อกันการเขียนช่วงเดียวกันซ้อนกันจากหลาย worker
+    with _locked(lock_path):
+        upload = get_upload(upload_id, owner)
+        if upload.get('complete'):
+            return upload
+        with open(part_path, 'ab') as f:
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadError("ตำแหน่งข้อมูลไม่ตรงกัน", 409, offset=current)
+            remaining = upload['size'] - current
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    f.truncate(current)
+                    raise UploadError("ข้อมูลเกินขนาดไฟล์ที่แจ้งไว้", 413, offset=current)
+                f.write(chunk)
+                remaining -= len(chunk)
+            upload['offset'] = upload['size'] - remaining
+        if upload['offset'] == upload['size']:
+            return finalize_upload(upload)
+    return upload
+
+
+def finalize_upload(upload):
+    """
+    คำนวณ SHA-256 แล้วย้ายไฟล์เข้าที่เก็บ ถ้ามีไฟล์เดียวกันอยู่แล้วจะใช้ของเดิม
+    metadata (พร้อม sha256) ยังเก็บไว้จนหมดอายุ เพื่อตอบ client ที่ส่งช่วงสุดท้ายซ้ำ
+    """
+    meta_path, part_path, _ = _upload_paths(upload['id'])
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    target_dir = os.path.join(OBJECTS_DIR, sha256[:2])
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, sha256)
+    if os.path.exists(target):
+        os.remove(part_path)
+    else:
+        os.replace(part_path, target)
+    _record_owner(sha256, upload['owner'])
+
+    upload = {key: value for key, value in upload.items() if key != 'offset'}
+    upload['sha256'] = sha256
+    _write_meta(meta_path, upload)
+    return dict(upload, offset=upload['size'], complete=True)
+
+
+def parse_evidence_files(raw, owner, attached=()):
+    """
+    แปลงค่าจาก hidden field (JSON) เป็นรายการไฟล์
+    เก็บเฉพาะไฟล์ที่ owner อัปโหลดเอง หรือที่แนบกับคำขอนี้อยู่แล้ว (attached เป็น sha256)
+    """
+    if not raw:
+        return []
+    try:
+        items = json.loads(raw)
+    except ValueError:
+        return []
+    if not isinstance(items, list):
+        return []
+    files = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        sha256 = str(item.get('sha256', ''))
+        path = object_path(sha256)
+        if not path or (sha256 not in attached and not uploaded_by(sha256, owner)):
+            continue
+        files.append({
+            "sha256": sha256,
+            "name": os.path.basename(str(item.get('name') or sha256)),
+            "size": os.path.getsize(path),
+        })
+    return files
@@ -0,0 +1,422 @@
+"""
+Load test แบบ end-to-end: จำลองผู้ใช้ทุกบทบาทพร้อมกันกับเซิร์ฟเวอร์ที่เปิดขึ้นในเครื่อง
+
+ขั้นตอนต่อหนึ่งคำขอ
+  applicant  บันทึกแบบร่าง (N ผลงาน) แล้วส่งคำขอ
+  admin      ตรวจความครบถ้วน (pass) -> งานวิจัย
+  research   รับงานจากคิว (/review/next) แล้วยืนยันผลงานถูกต้อง
+  admin      ส่งต่อคณะกรรมการ
+  committee  รับงานจากคิว อนุมัติ หรือไม่อนุมัติ (ประมาณ --reject-ratio)
+  applicant  ยื่นอุทธรณ์คำขอที่ไม่ผ่าน -> committee อนุมัติ
+
+เซิร์ฟเวอร์รันบนสำเนาข้อมูลในไดเรกทอรีชั่วคราว ไม่แตะไฟล์ข้อมูลจริง
+เมื่อจบจะรายงาน throughput, p50/p95/p99 ต่อ route, อัตรา error และตรวจความถูกต้องของข้อมูล
+
+ใช้งาน: python loadtest.py --applicants 20 --requests-per-applicant 3 --works 5 --reviewers 4
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'load123'
+
+_ROUTE_PATTERNS = [
+    (re.compile(r'^/view_request/[^/]+$'), '/view_request/<id>'),
+    (re.compile(r'^/appeal/[^/]+$'), '/appeal/<id>'),
+]
+
+
+def route_label(method, path):
+    path = urllib.parse.urlsplit(path).path
+    for pattern, label in _ROUTE_PATTERNS:
+        if pattern.match(path):
+            path = label
+            break
+    return f"{method} {path}"
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, label, seconds, ok):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            if not ok:
+                self.errors[label] += 1
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # วัดเวลาแต่ละ route แยกกัน ไม่ตาม redirect อัตโนมัติ
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """ผู้ใช้หนึ่งคน (cookie session ของตัวเอง)"""
+    def __init__(self, base_url, metrics, timeout):
+        self.base_url = base_url
+        self.metrics = metrics
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def call(self, method, path, data=None):
+        """คืนค่า (status, location) โดย 2xx/3xx ถือว่าสำเร็จ"""
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        start = time.perf_counter()
+        status, location = None, None
+        try:
+            with self.opener.open(req, timeout=self.timeout) as res:
+                res.read()
+                status = res.status
+        except urllib.error.HTTPError as e:
+            status, location = e.code, e.headers.get('Location')
+            e.read()
+        except OSError:
+            status = None
+        ok = status is not None and status < 400
+        self.metrics.record(route_label(method, path), time.perf_counter() - start, ok)
+        return status, location
+
+    def login(self, username):
+        return self.call('POST', '/login', {'username': username, 'password': PASSWORD})
+
+
+def make_works(n, seed):
+    return [{"type": "research",
+             "details": {"title": f"ผลงานทดสอบ {seed}-{k}", "journal_name": "Load Test Journal",
+                         "database": "scopus_q1_q2", "contribution": "first"}}
+            for k in range(n)]
+
+
+def should_reject(req_id, ratio):
+    return (zlib.crc32(req_id.encode()) % 1000) < ratio * 1000
+
+
+class Workflow:
+    """ส่งต่องานระหว่างบทบาทผ่านคิว และเก็บผลที่คาดหวังไว้ตรวจตอนจบ"""
+    def __init__(self, args, base_url, metrics):
+        self.args = args
+        self.base_url = base_url
+        self.metrics = metrics
+        self.admin_q = queue.Queue()      # (req_id, action)
+        self.research_q = queue.Queue()   # token: มีงานรอในคิวงานวิจัย
+        self.committee_q = queue.Queue()  # token: มีงานรอในคิวกรรมการ
+        self.appeal_q = queue.Queue()     # (applicant, req_id)
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.submitted = {}   # req_id -> applicant
+        self.rejected = set()
+        self.approved = {}    # req_id -> amount
+        self.failures = []
+        self.applicants_left = args.applicants
+
+    def session(self):
+        return Session(self.base_url, self.metrics, self.args.timeout)
+
+    def fail(self, message):
+        with self.lock:
+            self.failures.append(message)
+
+    def _finish(self, req_id=None, amount=None):
+        with self.lock:
+            if req_id:
+                self.approved[req_id] = amount
+            else:
+                self.applicants_left -= 1
+            # จบเมื่อผู้ยื่นส่งครบแล้ว และทุกคำขอที่ส่งสำเร็จได้รับอนุมัติ
+            if self.applicants_left == 0 and len(self.approved) == len(self.submitted):
+                self.done.set()
+
+    def applicant(self, index):
+        username = f"load_applicant_{index}"
+        s = self.session()
+        s.login(username)
+        for j in range(self.args.requests_per_applicant):
+            req_id = f"REQ-LOAD-{index}-{j}"
+            works = json.dumps(make_works(self.args.works, req_id), ensure_ascii=False)
+            form = {'req_id': req_id, 'works_data': works, 'fiscal_year_req': '2569',
+                    'academic_position': 'ผศ.', 'certify': 'on'}
+            s.call('GET', '/new_request')
+            s.call('POST', '/new_request', dict(form, action='draft'))
+            status, _ = s.call('POST', '/new_request', dict(form, action='submit'))
+            if status != 302:
+                self.fail(f"{req_id}: submit ได้ status {status}")
+                continue
+            with self.lock:
+                self.submitted[req_id] = username
+            s.call('GET', '/dashboard')
+            self.admin_q.put((req_id, 'pass'))
+        self._finish()
+
+    def appellant(self):
+        while not self.done.is_set():
+            try:
+                username, req_id = self.appeal_q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            s = self.session()
+            s.login(username)
+            s.call('GET', f'/view_request/{req_id}')
+            s.call('GET', f'/appeal/{req_id}')
+            s.call('POST', f'/appeal/{req_id}', {'reason': 'ขอให้พิจารณาใหม่', 'evidence_link': ''})
+            self.committee_q.put(True)
+
+    def administration(self, index):
+        s = self.session()
+        s.login(f"load_admin_{index}")
+        while not self.done.is_set():
+            try:
+                req_id, action = self.admin_q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            s.call('GET', f'/view_request/{req_id}')
+            s.call('POST', f'/view_request/{req_id}', {'action': action, 'comment': ''})
+            (self.research_q if action == 'pass' else self.committee_q).put(True)
+
+    def _claim(self, s, tokens):
+        """รอ token แล้วรับงานจาก /review/next คืนค่า req_id หรือ None"""
+        try:
+            tokens.get(timeout=0.2)
+        except queue.Empty:
+            return None
+        query = ''
+        if self.args.shard_by_faculty:
+            query = '?' + urllib.parse.urlencode({'faculty': 'คณะทดสอบ'})
+        status, location = s.call('GET', '/review/next' + query)
+        match = re.search(r'/view_request/([^/?]+)$', location or '')
+        if not match:
+            # ยังไม่เห็นคำขอ (เช่นกำลังถูกผู้อื่นถือ lease) คืน token แล้วลองใหม่
+            tokens.put(True)
+            time.sleep(0.05)
+            return None
+        return urllib.parse.unquote(match.group(1))
+
+    def research(self, index):
+        s = self.session()
+        s.login(f"load_research_{index}")
+        while not self.done.is_set():
+            req_id = self._claim(s, self.research_q)
+            if not req_id:
+                continue
+            s.call('GET', f'/view_request/{req_id}')
+            s.call('POST', f'/view_request/{req_id}', {'action': 'verify'})
+            self.admin_q.put((req_id, 'to_committee'))
+
+    def committee(self, index):
+        s = self.session()
+        s.login(f"load_committee_{index}")
+        while not self.done.is_set():
+            req_id = self._claim(s, self.committee_q)
+            if not req_id:
+                continue
+            s.call('GET', f'/view_request/{req_id}')
+            with self.lock:
+                appealed = req_id in self.rejected
+            if not appealed and should_reject(req_id, self.args.reject_ratio):
+                s.call('POST', f'/view_request/{req_id}', {'action': 'reject', 'comment': 'ทดสอบไม่อนุมัติ'})
+                with self.lock:
+                    self.rejected.add(req_id)
+                    applicant = self.submitted[req_id]
+                self.appeal_q.put((applicant, req_id))
+            else:
+                amount = str(1000 + zlib.crc32(req_id.encode()) % 9000)
+                s.call('POST', f'/view_request/{req_id}', {'action': 'approve', 'amount': amount})
+                self._finish(req_id, amount)
+
+
+def prepare_data_dir(args):
+    data_dir = tempfile.mkdtemp(prefix='loadtest-')
+    shutil.copy(os.path.join(BASE_DIR, 'criteria.json'), data_dir)
+    # เปิดรับคำขอตั้งแต่เมื่อวานถึงพรุ่งนี้ (is_within_timeline เทียบกับเวลา 00:00 ของ end_date)
+    start_date = (datetime.now() - timedelta(days=1)).strftime("%d/%m/%Y")
+    end_date = (datetime.now() + timedelta(days=1)).strftime("%d/%m/%Y")
+    users = []
+    for i in range(args.applicants):
+        users.append({"username": f"load_applicant_{i}", "password": PASSWORD, "role": "applicant",
+                      "name": f"ผู้ยื่นทดสอบ {i}", "title_name": "นาย", "academic_position": "ผศ.",
+                      "position_date": "01/01/2560", "position_number": str(10000 + i),
+                      "department": "ภาควิชาทดสอบ", "faculty": "คณะทดสอบ"})
+    for role, prefix in (('administration', 'load_admin'), ('research', 'load_research'),
+                         ('committee', 'load_committee')):
+        for i in range(args.reviewers):
+            users.append({"username": f"{prefix}_{i}", "password": PASSWORD, "role": role,
+                          "name": f"{role} {i}"})
+    for name, data in (('users.json', users), ('requests.json', []),
+                       ('timeline.json', {"fiscal_year": "2569", "start_date": start_date, "end_date": end_date,
+                                          "description": "load test"})):
+        with open(os.path.join(data_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+    return data_dir
+
+
+def start_server(args, data_dir):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PYTHONPATH=BASE_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    log = open(os.path.join(data_dir, 'server.log'), 'w')
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port),
+                             '--surge', args.surge],
+                            cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).read()
+            return proc, base_url
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("เปิดเซิร์ฟเวอร์ไม่สำเร็จ")
+
+
+def serve(port, surge):
+    from app import app
+    app.config['SURGE_MODE'] = surge
+    try:
+        app.run(host='127.0.0.1', port=port, threaded=True, debug=False, use_reloader=False)
+    except KeyboardInterrupt:
+        pass  # atexit จะ flush write-behind queue ก่อนปิด
+
+
+def percentile(values, p):
+    return values[max(0, int(round(p / 100 * len(values))) - 1)]
+
+
+def report(metrics, elapsed):
+    total = sum(len(v) for v in metrics.latencies.values())
+    errors = sum(metrics.errors.values())
+    print(f"\n{total} requests in {elapsed:.2f}s -> {total / elapsed:.1f} req/s, "
+          f"errors {errors} ({errors / total * 100 if total else 0:.2f}%)\n")
+    print(f"{'route':32} {'count':>7} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label in sorted(metrics.latencies):
+        values = sorted(metrics.latencies[label])
+        err = metrics.errors[label] / len(values) * 100
+        print(f"{label:32} {len(values):7d} {err:6.2f} {percentile(values, 50) * 1000:8.1f} "
+              f"{percentile(values, 95) * 1000:8.1f} {percentile(values, 99) * 1000:8.1f}")
+
+
+def check_integrity(flow, data_dir):
+    """ตรวจว่าไม่มีการเขียนทับกันจนข้อมูลหาย และสถานะตรงกับที่ผู้ใช้จำลองทำไว้"""
+    with open(os.path.join(data_dir, 'requests.json'), 'r', encoding='utf-8') as f:
+        all_reqs = json.load(f)
+    problems = list(flow.failures)
+    by_id = defaultdict(list)
+    for r in all_reqs:
+        by_id[r['id']].append(r)
+
+    for req_id, records in by_id.items():
+        if len(records) > 1:
+            problems.append(f"{req_id}: มี {len(records)} รายการซ้ำกัน")
+    for req_id in flow.submitted:
+        records = by_id.get(req_id)
+        if not records:
+            problems.append(f"{req_id}: คำขอหาย (lost update)")
+            continue
+        r = records[0]
+        if r['status'] != 'อนุมัติ':
+            problems.append(f"{req_id}: สถานะ {r['status']} (คาดว่า อนุมัติ)")
+        if r.get('approved_amount') != flow.approved.get(req_id):
+            problems.append(f"{req_id}: approved_amount {r.get('approved_amount')} != {flow.approved.get(req_id)}")
+        if len(r.get('works', [])) != flow.args.works:
+            problems.append(f"{req_id}: มีผลงาน {len(r.get('works', []))} รายการ (คาดว่า {flow.args.works})")
+        if (req_id in flow.rejected) != ('appeal' in r):
+            problems.append(f"{req_id}: ข้อมูลอุทธรณ์ไม่ตรงกับที่ยื่น")
+    unexpected = set(by_id) - set(flow.submitted)
+    if unexpected:
+        problems.append(f"มีคำขอที่ไม่ได้ส่ง {len(unexpected)} รายการ")
+
+    statuses = defaultdict(int)
+    for r in all_reqs:
+        statuses[r['status']] += 1
+    expected = flow.args.applicants * flow.args.requests_per_applicant
+    print(f"\nintegrity: submitted {len(flow.submitted)}/{expected}, stored {len(all_reqs)}, "
+          f"approved {len(flow.approved)}, appealed {len(flow.rejected)}, statuses {dict(statuses)}")
+    for p in problems[:20]:
+        print(f"  FAIL {p}")
+    if len(problems) > 20:
+        print(f"  ... และอีก {len(problems) - 20} รายการ")
+    print("  OK" if not problems else f"  {len(problems)} problems")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--applicants', type=int, default=20, help="จำนวนผู้ยื่นที่ทำงานพร้อมกัน")
+    parser.add_argument('--requests-per-applicant', type=int, default=3)
+    parser.add_argument('--works', type=int, default=5, help="จำนวนผลงานต่อคำขอ")
+    parser.add_argument('--reviewers', type=int, default=4, help="จำนวนเจ้าหน้าที่ต่อบทบาท")
+    parser.add_argument('--reject-ratio', type=float, default=0.2)
+    parser.add_argument('--shard-by-faculty', action='store_true')
+    parser.add_argument('--surge', choices=['on', 'off', 'auto'], default='off')
+    parser.add_argument('--timeout', type=float, default=30.0, help="timeout ต่อ HTTP request (วินาที)")
+    parser.add_argument('--max-duration', type=float, default=600.0)
+    parser.add_argument('--keep-data', action='store_true', help="ไม่ลบไดเรกทอรีข้อมูลชั่วคราว")
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.surge)
+
+    data_dir = prepare_data_dir(args)
+    proc, base_url = start_server(args, data_dir)
+    metrics = Metrics()
+    flow = Workflow(args, base_url, metrics)
+    print(f"server {base_url} (data {data_dir}), surge={args.surge}, "
+          f"{args.applicants} applicants x {args.requests_per_applicant} requests x {args.works} works, "
+          f"{args.reviewers} staff per role")
+
+    threads = [threading.Thread(target=flow.applicant, args=(i,)) for i in range(args.applicants)]
+    for i in range(args.reviewers):
+        threads += [threading.Thread(target=flow.administration, args=(i,), daemon=True),
+                    threading.Thread(target=flow.research, args=(i,), daemon=True),
+                    threading.Thread(target=flow.committee, args=(i,), daemon=True),
+                    threading.Thread(target=flow.appellant, daemon=True)]
+    start = time.perf_counter()
+    for t in threads: t.start()
+    if not flow.done.wait(args.max_duration):
+        flow.fail(f"workflow ไม่จบภายใน {args.max_duration:.0f} วินาที")
+        flow.done.set()
+    elapsed = time.perf_counter() - start
+    for t in threads: t.join(timeout=args.timeout)
+
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+    report(metrics, elapsed)
+    ok = check_integrity(flow, data_dir)
+    if not args.keep_data:
+        shutil.rmtree(data_dir)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+คิวงานตรวจสอบแบบ lease สำหรับงานวิจัยและคณะกรรมการ
+
+ผู้ตรวจกด "รับงานถัดไป" แล้วได้คำขอที่ยังไม่มีใครถือ (เลือกเฉพาะคณะได้) หรือกดรับคำขอที่เปิดดูอยู่เอง
+การเปิดดูคำขอเฉย ๆ ไม่ถือ lease
+lease จะหมดอายุเองถ้าผู้ตรวจไม่กลับมาต่ออายุ และถูกปล่อยเมื่อบันทึกผลการตรวจ
+ทุกการแก้ไข leases.json ทำภายใต้ file lock จึงปลอดภัยเมื่อมีหลาย worker
+"""
+import time
+
+import storage
+
+LEASES_FILE = 'leases.json'
+LEASE_SECONDS = 15 * 60
+
+# role -> สถานะคำขอที่อยู่ในคิวของ role นั้น
+QUEUE_STATUSES = {
+    'research': ('รอตรวจสอบผลงาน',),
+    'committee': ('รอการพิจารณา', 'รอการอุทธรณ์'),
+}
+
+
+def _active(leases, now):
+    return {req_id: lease for req_id, lease in leases.items() if lease['expires'] > now}
+
+
+def active_leases():
+    """lease ที่ยังไม่หมดอายุทั้งหมด {req_id: lease} (อ่านอย่างเดียว ไม่ล็อก)"""
+    return _active(storage.read_json(LEASES_FILE, {}), time.time())
+
+
+def in_queue(req_data, role):
+    return req_data['status'] in QUEUE_STATUSES.get(role, ())
+
+
+def claim_next(load_requests, role, reviewer, reviewer_name='', faculty=None, ttl=LEASE_SECONDS):
+    """
+    รับคำขอถัดไปในคิวของ role ที่ยังไม่มีผู้ถือ lease แล้วคืนค่า id (หรือ None ถ้าคิวว่าง)
+    ถ้าผู้ตรวจถือ lease ค้างอยู่แล้วจะได้คำขอเดิมกลับไปก่อน
+    load_requests ถูกเรียกหลังได้ lock แล้ว เพื่อไม่ให้หยิบคำขอที่ผู้อื่นเพิ่งตรวจเสร็จและปล่อย lease
+    """
+    now = time.time()
+    with storage.file_lock(LEASES_FILE):
+        queued = [r for r in load_requests() if in_queue(r, role)
+                  and (not faculty or (r.get('applicant_info') or {}).get('faculty') == faculty)]
+        leases = _active(storage.read_json(LEASES_FILE, {}), now)
+        req_id = next((r['id'] for r in queued
+                       if leases.get(r['id'], {}).get('reviewer') == reviewer), None)
+        if req_id is None:
+            req_id = next((r['id'] for r in queued if r['id'] not in leases), None)
+        if req_id is not None:
+            leases[req_id] = {"reviewer": reviewer, "reviewer_name": reviewer_name,
+                              "role": role, "expires": now + ttl}
+        storage.write_json_atomic(LEASES_FILE, leases, fsync=False)
+    return req_id
+
+
+def acquire(req_id, role, reviewer, reviewer_name='', ttl=LEASE_SECONDS):
+    """
+    ถือ lease ของคำขอที่ระบุ (หรือต่ออายุถ้าถืออยู่แล้ว)
+    คืนค่า None ถ้าสำเร็จ หรือ lease ของผู้อื่นที่ถืออยู่
+    """
+    now = time.time()
+    with storage.file_lock(LEASES_FILE):
+        leases = _active(storage.read_json(LEASES_FILE, {}), now)
+        lease = leases.get(req_id)
+        if lease and lease['reviewer'] != reviewer:
+            return lease
+        leases[req_id] = {"reviewer": reviewer, "reviewer_name": reviewer_name,
+                          "role": role, "expires": now + ttl}
+        storage.write_json_atomic(LEASES_FILE, leases, fsync=False)
+    return None
+
+
+def renew(req_id, reviewer, ttl=LEASE_SECONDS):
+    """ต่ออายุ lease ที่ผู้ตรวจถืออยู่แล้วเท่านั้น คืนค่า True ถ้ายังถืออยู่"""
+    now = time.time()
+    with storage.file_lock(LEASES_FILE):
+        leases = _active(storage.read_json(LEASES_FILE, {}), now)
+        lease = leases.get(req_id)
+        if not lease or lease['reviewer'] != reviewer:
+            return False
+        lease['expires'] = now + ttl
+        storage.write_json_atomic(LEASES_FILE, leases, fsync=False)
+    return True
+
+
+def release(req_id, reviewer):
+    """ปล่อย lease หลังบันทึกผลการตรวจ (ไม่มีผลถ้าผู้อื่นเป็นผู้ถือ)"""
+    with storage.file_lock(LEASES_FILE):
+        leases = _active(storage.read_json(LEASES_FILE, {}), time.time())
+        if leases.get(req_id, {}).get('reviewer') == reviewer:
+            del leases[req_id]
+        storage.write_json_atomic(LEASES_FILE, leases, fsync=False)
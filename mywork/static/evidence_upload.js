@@ -0,0 +1,85 @@
+// อัปโหลดไฟล์หลักฐานทีละช่วง (chunk) และอัปโหลดต่อจากจุดเดิมได้ถ้าการเชื่อมต่อขาด
+// ใช้คู่กับ <input type="file" data-evidence-target="evidence_files"> และ hidden field ชื่อเดียวกัน
+const EVIDENCE_CHUNK_SIZE = 1024 * 1024;
+
+function evidenceResumeKey(file) {
+    return `evidence-upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function evidenceStartUpload(file) {
+    // ถ้าเคยอัปโหลดไฟล์นี้ค้างไว้ ให้ถามตำแหน่งล่าสุดจากเซิร์ฟเวอร์
+    const savedId = localStorage.getItem(evidenceResumeKey(file));
+    if (savedId) {
+        const res = await fetch(`/evidence/uploads/${savedId}`);
+        if (res.ok) return await res.json();
+        localStorage.removeItem(evidenceResumeKey(file));
+    }
+    const res = await fetch('/evidence/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ name: file.name, size: file.size })
+    });
+    const upload = await res.json();
+    if (!res.ok) throw new Error(upload.error);
+    localStorage.setItem(evidenceResumeKey(file), upload.id);
+    return upload;
+}
+
+async function evidenceUploadFile(file, onProgress) {
+    const upload = await evidenceStartUpload(file);
+    let offset = upload.offset;
+    let result = upload;
+    while (offset < file.size) {
+        const res = await fetch(`/evidence/uploads/${upload.id}`, {
+            method: 'PUT',
+            headers: { 'Upload-Offset': offset, 'Content-Type': 'application/octet-stream' },
+            body: file.slice(offset, offset + EVIDENCE_CHUNK_SIZE)
+        });
+        result = await res.json();
+        if (res.status === 409 && result.offset !== null) {
+            offset = result.offset; // เซิร์ฟเวอร์มีข้อมูลถึงตำแหน่งอื่น ส่งต่อจากตรงนั้น
+            continue;
+        }
+        if (!res.ok) throw new Error(result.error);
+        offset = result.complete ? file.size : result.offset;
+        onProgress(offset / file.size);
+    }
+    localStorage.removeItem(evidenceResumeKey(file));
+    return result;
+}
+
+function evidenceRenderList(input, files) {
+    const list = document.getElementById(input.dataset.evidenceList);
+    list.innerHTML = '';
+    files.forEach(f => {
+        const li = document.createElement('li');
+        li.textContent = `${f.name} (${(f.size / 1024).toFixed(1)} KB)`;
+        list.appendChild(li);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('input[data-evidence-target]').forEach(input => {
+        const hidden = document.querySelector(`input[name="${input.dataset.evidenceTarget}"]`);
+        const status = document.getElementById(input.dataset.evidenceStatus);
+        const files = JSON.parse(hidden.value || '[]');
+        evidenceRenderList(input, files);
+
+        input.addEventListener('change', async () => {
+            for (const file of input.files) {
+                try {
+                    const result = await evidenceUploadFile(file, p => {
+                        status.textContent = `กำลังอัปโหลด ${file.name} ${(p * 100).toFixed(0)}%`;
+                    });
+                    files.push({ sha256: result.sha256, name: result.name, size: result.size });
+                    hidden.value = JSON.stringify(files);
+                    evidenceRenderList(input, files);
+                    status.textContent = 'อัปโหลดเรียบร้อยแล้ว';
+                } catch (e) {
+                    status.textContent = `อัปโหลดไม่สำเร็จ: ${e.message} (เลือกไฟล์เดิมอีกครั้งเพื่ออัปโหลดต่อ)`;
+                }
+            }
+            input.value = '';
+        });
+    });
+});
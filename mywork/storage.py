@@ -0,0 +1,71 @@
+"""
+ตัวช่วยอ่าน/เขียนไฟล์ JSON ให้ปลอดภัยเมื่อมีหลาย thread หรือหลาย worker เขียนพร้อมกัน
+"""
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path):
+    """ล็อกแบบ exclusive ข้าม process ด้วยไฟล์ <path>.lock"""
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_json(path, default=None):
+    """อ่านไฟล์ JSON คืน default ถ้าไม่มีไฟล์หรือไฟล์ว่าง (ไฟล์เสียจะ raise เพื่อไม่ให้เขียนทับ)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return default
+    if not content.strip():
+        return default
+    return json.loads(content)
+
+
+def write_json_atomic(path, data, fsync=True):
+    """
+    เขียนลงไฟล์ชั่วคราวแล้ว os.replace ทับ ผู้อ่านจะเห็นไฟล์เดิมหรือไฟล์ใหม่ทั้งไฟล์เสมอ
+    fsync=True จะ fsync ทั้งไฟล์และไดเรกทอรีเพื่อให้ข้อมูลคงอยู่แม้ไฟดับ
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path), dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if fsync:
+        _fsync_dir(directory)
+
+
+def fsync_file(path):
+    """fsync ไฟล์ที่เขียนไปแล้ว (เช่นที่เขียนด้วย fsync=False) พร้อมไดเรกทอรีของไฟล์"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def _fsync_dir(directory):
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,94 @@
+"""
+วัด throughput ของการบันทึกคำขอภายใต้ burst จำลอง (ช่วงใกล้วันปิดรับคำขอ)
+
+เปรียบเทียบ
+  direct     : read-modify-write requests.json ทีละคำขอ (แบบเดิม)
+  write-behind: ตอบรับทันทีแล้วให้ writer thread รวบรวมเขียนแบบ group commit
+
+ใช้งาน: python surge_bench.py --submitters 50 --per-submitter 20 --existing 2000 --fsync always
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import storage
+import write_behind
+
+
+def make_request(i):
+    return {
+        "id": f"REQ-BENCH-{i}-{uuid.uuid4().hex[:6]}",
+        "applicant": "user01",
+        "applicant_name": "อาจารย์ สมชาย",
+        "works": [{"type": "research", "details": {"title": f"ผลงาน {i}", "database": "scopus_q1_q2", "contribution": "first"},
+                   "calculated_score": 1.25, "calculated_weight": 1.0, "net_score": 1.25}],
+        "status": "ส่งแล้ว",
+        "score": 1.25,
+    }
+
+
+def run(mode, args):
+    workdir = tempfile.mkdtemp(prefix='surge-bench-')
+    filename = os.path.join(workdir, 'requests.json')
+    storage.write_json_atomic(filename, [make_request(f"old-{i}") for i in range(args.existing)], fsync=False)
+
+    writer = write_behind.RequestWriter(filename, max_batch_delay=args.max_batch_delay,
+                                        max_batch_size=args.max_batch_size, fsync=args.fsync)
+    latencies = []
+    lat_lock = threading.Lock()
+
+    def submitter(n):
+        local = []
+        for j in range(args.per_submitter):
+            req_data = make_request(f"{n}-{j}")
+            t0 = time.perf_counter()
+            if mode == 'direct':
+                writer.commit([req_data])
+            else:
+                writer.submit(req_data)
+            local.append(time.perf_counter() - t0)
+        with lat_lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=submitter, args=(n,)) for n in range(args.submitters)]
+    start = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    acked = time.perf_counter() - start
+    writer.flush()
+    durable = time.perf_counter() - start
+
+    total = args.submitters * args.per_submitter
+    saved = len(storage.read_json(filename, [])) - args.existing
+    latencies.sort()
+    print(f"[{mode}] {total} submissions, {saved} saved, {writer.stats['commits']} commits")
+    print(f"  ack throughput:     {total / acked:10.1f} req/s")
+    print(f"  durable throughput: {total / durable:10.1f} req/s")
+    print(f"  ack latency p50={statistics.median(latencies) * 1000:.2f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f}ms "
+          f"max={latencies[-1] * 1000:.2f}ms")
+    shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submitters', type=int, default=50)
+    parser.add_argument('--per-submitter', type=int, default=20)
+    parser.add_argument('--existing', type=int, default=2000, help="จำนวนคำขอเดิมใน requests.json")
+    parser.add_argument('--max-batch-delay', type=float, default=0.05)
+    parser.add_argument('--max-batch-size', type=int, default=500)
+    parser.add_argument('--fsync', choices=write_behind.FSYNC_POLICIES, default='always')
+    parser.add_argument('--mode', choices=['direct', 'write-behind', 'both'], default='both')
+    args = parser.parse_args()
+
+    for mode in (['direct', 'write-behind'] if args.mode == 'both' else [args.mode]):
+        run(mode, args)
+
+
+if __name__ == '__main__':
+    main()
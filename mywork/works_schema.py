@@ -0,0 +1,149 @@
+"""
+Schema ของข้อมูลผลงาน (works_data) ที่ส่งมาจากหน้า new_request
+
+compile_validator() แปลง WORKS_SCHEMA เป็นฟังก์ชันตรวจสอบครั้งเดียวตอนเริ่มระบบ
+แล้วใช้ตรวจทุกคำขอในรอบเดียว (ตรวจขนาด -> parse -> โครงสร้าง/ชนิดข้อมูล/ค่าที่อนุญาต)
+ก่อนเริ่มคำนวณคะแนน
+"""
+import json
+
+TEXT = 'text'
+FLAG = 'flag'
+
+_LEVEL = ('A+', 'A', 'B')
+_CONTRIB = ('first', 'intellectual')
+
+# ประเภทผลงาน -> {ชื่อฟิลด์ใน details: TEXT | FLAG | tuple ของค่าที่อนุญาต}
+WORKS_SCHEMA = {
+    'research': {
+        'title': TEXT, 'journal_name': TEXT, 'vol': TEXT, 'issue': TEXT, 'month': TEXT,
+        'year_pub': TEXT, 'date_accept': TEXT, 'date_publish': TEXT,
+        'database': ('scopus_q1_q2', 'scopus_other', 'national'),
+        'contribution': ('first', 'corresponding', 'main', 'intellectual', 'co'),
+    },
+    'textbook': {
+        'title': TEXT, 'chapter_details': TEXT, 'date_publish': TEXT,
+        'format': ('authored', 'chapter'),
+        'publish_type': ('inter', 'local'),
+        'contribution': _CONTRIB,
+    },
+    'creative': {
+        'title': TEXT, 'evidence_peer': FLAG, 'evidence_paper': FLAG,
+        'creative_type': ('', 'visual', 'design', 'arch', 'music', 'perfor', 'other'),
+        'publish_type': ('inter_print', 'inter_exhibit', 'inter_perf',
+                         'coop_print', 'coop_exhibit', 'coop_perf',
+                         'national_print', 'national_exhibit', 'national_perf'),
+        'contribution': _CONTRIB,
+    },
+    'social': {
+        'title': TEXT, 'dissemination_summary': TEXT, 'format_doc': FLAG, 'format_evidence': FLAG,
+        'database': _LEVEL, 'contribution': _CONTRIB,
+    },
+    'industry': {
+        'title': TEXT,
+        'publish_type': ('article', 'report', 'ip', 'confidential', 'external_eval'),
+        'database': _LEVEL, 'contribution': _CONTRIB,
+    },
+    'teaching': {
+        'title': TEXT, 'database': _LEVEL, 'contribution': _CONTRIB,
+    },
+    'policy': {
+        'title': TEXT, 'dissemination_summary': TEXT,
+        'publish_type': ('presented', 'public'),
+        'database': _LEVEL, 'contribution': _CONTRIB,
+    },
+    'innovation': {
+        'title': TEXT, 'dissemination_summary': TEXT,
+        'format_career': FLAG, 'format_innovation': FLAG, 'format_other': FLAG,
+        'type': ('report', 'ip', 'public', 'diffusion'),
+        'database': _LEVEL, 'contribution': _CONTRIB,
+    },
+}
+# ชื่อประเภทเดิมที่ฝั่ง server ยังรองรับ
+WORKS_SCHEMA['local'] = WORKS_SCHEMA['social']
+WORKS_SCHEMA['patent'] = WORKS_SCHEMA['innovation']
+
+MAX_ERRORS = 20
+
+
+def _text_checker(max_string):
+    message = f"ต้องเป็นข้อความยาวไม่เกิน {max_string} ตัวอักษร"
+    def check(value):
+        if not isinstance(value, str) or len(value) > max_string: return message
+    return check
+
+
+def _flag_checker():
+    def check(value):
+        if not isinstance(value, bool): return "ต้องเป็นค่า true/false"
+    return check
+
+
+def _choice_checker(choices):
+    allowed = frozenset(choices)
+    message = "ค่าไม่ถูกต้อง (ต้องเป็นหนึ่งใน: " + ", ".join(c for c in choices if c) + ")"
+    def check(value):
+        if not isinstance(value, str) or value not in allowed: return message
+    return check
+
+
+def compile_validator(schema=WORKS_SCHEMA, max_bytes=256 * 1024, max_works=50, max_string=2000):
+    """
+    คืนฟังก์ชัน validate(raw) -> (works, errors)
+    errors เป็น list ของ (ตำแหน่งฟิลด์, ข้อความ) ถ้าว่างแปลว่าข้อมูลถูกต้อง
+    works เป็นรายการที่ parse ได้ (แม้จะมีข้อผิดพลาดรายฟิลด์ เพื่อส่งกลับไปให้แก้ไข)
+    หรือ None ถ้าผิดพลาดที่ระดับ works_data ทั้งก้อน (เกินขนาด parse ไม่ได้ ไม่ใช่รายการ หรือจำนวนเกิน)
+    """
+    text = _text_checker(max_string)
+    flag = _flag_checker()
+    compiled = {}
+    for work_type, fields in schema.items():
+        compiled[work_type] = {
+            key: text if spec == TEXT else flag if spec == FLAG else _choice_checker(spec)
+            for key, spec in fields.items()
+        }
+    type_message = "ประเภทผลงานไม่ถูกต้อง"
+
+    def validate(raw):
+        if not raw:
+            return [], []
+        if len(raw.encode('utf-8')) > max_bytes:
+            return None, [("works_data", f"ข้อมูลผลงานมีขนาดเกิน {max_bytes // 1024} KB")]
+        try:
+            works = json.loads(raw)
+        except (ValueError, RecursionError):
+            return None, [("works_data", "รูปแบบข้อมูลผลงานไม่ถูกต้อง")]
+        if not isinstance(works, list):
+            return None, [("works_data", "ข้อมูลผลงานต้องเป็นรายการ")]
+        if len(works) > max_works:
+            return None, [("works_data", f"ยื่นผลงานได้ไม่เกิน {max_works} รายการ")]
+
+        errors = []
+        for i, work in enumerate(works):
+            if len(errors) >= MAX_ERRORS: break
+            path = f"ผลงานที่ {i + 1}"
+            if not isinstance(work, dict):
+                errors.append((path, "รูปแบบข้อมูลไม่ถูกต้อง"))
+                continue
+            for key in work:
+                if key not in ('type', 'details'):
+                    errors.append((f"{path}.{key[:50]}", "ไม่รู้จักฟิลด์นี้"))
+            fields = compiled.get(work.get('type')) if isinstance(work.get('type'), str) else None
+            if fields is None:
+                errors.append((f"{path}.type", type_message))
+                continue
+            if 'details' not in work:
+                errors.append((f"{path}.details", "ต้องระบุรายละเอียดผลงาน"))
+                continue
+            details = work['details']
+            if not isinstance(details, dict):
+                errors.append((f"{path}.details", "รูปแบบข้อมูลไม่ถูกต้อง"))
+                continue
+            for key, value in details.items():
+                check = fields.get(key)
+                message = check(value) if check else "ไม่รู้จักฟิลด์นี้"
+                if message:
+                    errors.append((f"{path}.{key[:50]}", message))
+        return works, errors[:MAX_ERRORS]
+
+    return validate
@@ -0,0 +1,226 @@
+"""
+Write-behind queue สำหรับ requests.json (ใช้ช่วงใกล้วันปิดรับคำขอ)
+
+คำขอที่ตรวจสอบและคำนวณคะแนนแล้วจะถูกตอบรับทันที แล้วให้ writer thread ตัวเดียว
+รวบรวมหลายรายการเขียนลงไฟล์ในครั้งเดียว (group commit) แทนการ read-modify-write ทีละคำขอ
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+MAX_COMMIT_FAILURES = 3  # commit ล้มเหลวติดกันเท่านี้ครั้งแล้วจะหยุดตอบรับรายการใหม่
+EXIT_FLUSH_TIMEOUT = 10.0
+
+
+class StorageError(Exception):
+    """อ่านหรือเขียน requests.json ไม่ได้ (ไฟล์เสีย หรือ writer commit ไม่สำเร็จติดต่อกัน)"""
+
+
+def _upsert(all_reqs, batch):
+    """รวมรายการใน batch เข้ากับ all_reqs ตาม id (รายการเดิมถูก update ไม่ใช่แทนที่ทั้งก้อน)"""
+    index = {r['id']: i for i, r in enumerate(all_reqs)}
+    for req_data in batch:
+        i = index.get(req_data['id'])
+        if i is None:
+            index[req_data['id']] = len(all_reqs)
+            all_reqs.append(req_data)
+        else:
+            all_reqs[i].update(req_data)
+    return all_reqs
+
+
+class RequestWriter:
+    """
+    max_batch_delay: เวลารอสูงสุด (วินาที) เพื่อรวบรวมรายการก่อน commit
+    max_batch_size:  จำนวนรายการสูงสุดต่อหนึ่ง commit
+    fsync:           'always'   fsync ทุก commit
+                     'interval' fsync อย่างมากทุก fsync_interval วินาที และไม่เกิน fsync_interval
+                                หลัง commit ที่ยังไม่ได้ fsync
+                     'never'    ปล่อยให้ระบบปฏิบัติการเขียนลงดิสก์เอง
+    """
+    def __init__(self, filename, max_batch_delay=0.05, max_batch_size=500,
+                 fsync='always', fsync_interval=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy ต้องเป็นหนึ่งใน {FSYNC_POLICIES}")
+        self.filename = filename
+        self.max_batch_delay = max_batch_delay
+        self.max_batch_size = max_batch_size
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._queue = queue.Queue()
+        self._pending = {}  # id -> [req_data, ...] ที่ตอบรับแล้วแต่ยังไม่ได้ commit (ตามลำดับที่ส่ง)
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        # commit() ถูกเรียกทั้งจาก request thread และ writer thread
+        self._stats_lock = threading.Lock()
+        self._last_fsync = 0.0
+        self._unsynced = False  # มี commit ที่ยังไม่ได้ fsync (ใช้กับ 'interval')
+        self._failing = False   # writer commit ล้มเหลวติดต่อกันจนหยุดตอบรับรายการใหม่
+        self.stats = {"commits": 0, "records": 0}
+
+    def commit(self, batch):
+        """เขียนรายการทั้งหมดใน batch ลงไฟล์ในครั้งเดียว (upsert ตาม id)"""
+        with storage.file_lock(self.filename):
+            try:
+                all_reqs = storage.read_json(self.filename, [])
+            except ValueError as e:
+                raise StorageError(f"{self.filename} เสียหาย อ่านไม่ได้") from e
+            all_reqs = _upsert(all_reqs, batch)
+            storage.write_json_atomic(self.filename, all_reqs, fsync=self._should_fsync())
+        with self._stats_lock:
+            self.stats['commits'] += 1
+            self.stats['records'] += len(batch)
+
+    def _should_fsync(self):
+        if self.fsync == 'always':
+            return True
+        if self.fsync == 'interval':
+            with self._stats_lock:
+                if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    self._last_fsync = time.monotonic()
+                    self._unsynced = False
+                    return True
+                self._unsynced = True
+            # ให้ writer thread fsync ตามมาภายใน fsync_interval แม้จะไม่มี commit ถัดไป
+            self._start_thread()
+        return False
+
+    def _seconds_until_fsync(self):
+        """เวลาที่เหลือก่อนต้อง fsync commit ที่ค้างอยู่ (None ถ้าไม่มี)"""
+        with self._stats_lock:
+            if not self._unsynced:
+                return None
+            return max(0.0, self._last_fsync + self.fsync_interval - time.monotonic())
+
+    def _fsync_pending(self):
+        """fsync commit ที่ค้างอยู่ (ถือ file lock จึงไม่มี commit ใหม่แทรกระหว่าง fsync)"""
+        with storage.file_lock(self.filename):
+            if self._seconds_until_fsync() is None:
+                return
+            storage.fsync_file(self.filename)
+            with self._stats_lock:
+                self._unsynced = False
+                self._last_fsync = time.monotonic()
+
+    def _start_thread(self):
+        with self._pending_lock:
+            self._start_thread_locked()
+
+    def _start_thread_locked(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='request-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_at_exit)
+
+    def submit(self, req_data):
+        """
+        ตอบรับคำขอทันที การเขียนลงไฟล์จะเกิดขึ้นใน writer thread
+        raise StorageError ถ้า writer commit ไม่สำเร็จติดต่อกัน (ไม่ตอบรับสิ่งที่อาจไม่ได้บันทึก)
+        """
+        req_data = copy.deepcopy(req_data)  # กันไม่ให้ผู้เรียกแก้ข้อมูลระหว่างรอเขียน
+        with self._pending_lock:
+            if self._failing:
+                raise StorageError(f"บันทึก {self.filename} ไม่สำเร็จ งดรับรายการใหม่จนกว่าจะเขียนได้")
+            self._pending.setdefault(req_data['id'], []).append(req_data)
+            self._start_thread_locked()
+            self._queue.put(req_data)  # ลำดับในคิวตรงกับลำดับใน _pending
+
+    def read_all(self):
+        """
+        อ่านคำขอทั้งหมดจากไฟล์รวมกับรายการที่ยังค้างในคิว
+        เปิดไฟล์และอ่านคิวภายใต้ lock เดียวกับที่ writer ใช้ลบรายการที่ commit แล้ว
+        จึงไม่มีช่วงที่รายการหายไปจากทั้งคิวและไฟล์ที่เปิดอยู่
+        รายการที่ค้างถูกรวมด้วยวิธีเดียวกับ commit() ผลจึงเหมือนกันทั้งก่อนและหลังเขียนลงไฟล์
+        """
+        with self._pending_lock:
+            try:
+                f = open(self.filename, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                f = None
+            pending = copy.deepcopy([r for queued in self._pending.values() for r in queued])
+        all_reqs = []
+        if f is not None:
+            with f:
+                content = f.read()
+            if content.strip():
+                try:
+                    all_reqs = json.loads(content)
+                except ValueError as e:
+                    raise StorageError(f"{self.filename} เสียหาย อ่านไม่ได้") from e
+        return _upsert(all_reqs, pending)
+
+    def has_pending(self):
+        with self._pending_lock:
+            return bool(self._pending)
+
+    def flush(self, timeout=None):
+        """รอจนทุกรายการในคิวถูก commit แล้ว คืนค่า False ถ้าหมดเวลาก่อน"""
+        if self._thread is None:
+            return True
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def _flush_at_exit(self):
+        # ไม่รอไม่รู้จบตอนปิดระบบ ถ้า commit ยังล้มเหลวอยู่
+        if not self.flush(EXIT_FLUSH_TIMEOUT):
+            with self._pending_lock:
+                lost = sum(len(queued) for queued in self._pending.values())
+            logger.error("ปิดระบบขณะที่ยังมี %d รายการไม่ได้เขียนลง %s", lost, self.filename)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self._seconds_until_fsync())]
+            except queue.Empty:
+                try:
+                    self._fsync_pending()
+                except OSError:
+                    logger.exception("fsync requests.json ไม่สำเร็จ จะลองใหม่")
+                    time.sleep(1)
+                continue
+            deadline = time.monotonic() + self.max_batch_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            failures = 0
+            while True:
+                try:
+                    self.commit(batch)
+                    break
+                except Exception:
+                    # ห้ามทิ้งรายการที่ตอบรับไปแล้ว ลองใหม่จนกว่าจะเขียนสำเร็จ
+                    # แต่หยุดตอบรับรายการใหม่ระหว่างนี้ ผู้ใช้จะได้รู้ว่าบันทึกไม่สำเร็จ
+                    failures += 1
+                    if failures == MAX_COMMIT_FAILURES:
+                        with self._pending_lock:
+                            self._failing = True
+                    logger.exception("commit requests.json ไม่สำเร็จ จะลองใหม่")
+                    time.sleep(1)
+            if failures >= MAX_COMMIT_FAILURES:
+                with self._pending_lock:
+                    self._failing = False
+
+            with self._pending_lock:
+                for req_data in batch:
+                    queued = self._pending[req_data['id']]
+                    queued[:] = [r for r in queued if r is not req_data]
+                    if not queued:
+                        del self._pending[req_data['id']]
+            for _ in batch:
+                self._queue.task_done()